@@ -4,8 +4,15 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from parser import find_item_id_by_name, find_item_by_name, get_auction_history, get_auction_active_lots
-from user_profiles import get_user_profile, add_to_favorites, remove_from_favorites, get_favorites
+from user_profiles import get_user_profile, add_to_favorites, remove_from_favorites, get_favorites, load_profiles
+from lot_tracker import record_snapshot, get_lot_stats, SNAPSHOT_LIMIT
+from resilience import UpstreamUnavailable, is_stale
+from deal_scanner import start_scanner, get_top_deals
+from message_queue import FloodLimiter, NotificationQueue
+import asyncio
+import logging
 import os
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -17,6 +24,29 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден")
 
+# ID администраторов через запятую, им доступна рассылка /announce
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id.strip()}
+
+logger = logging.getLogger(__name__)
+
+STALE_NOTE = "⚠️ Сервер аукциона недоступен, показаны последние сохраненные данные.\n\n"
+
+
+def format_lot_stats(item_id):
+    # Формирует строку со статистикой продаж за последний час
+    stats = get_lot_stats(item_id)
+    if stats is None:
+        return ""
+
+    message = (
+        f"За последний час: продано {stats['sold']} (шт.: {stats['sold_amount']}), "
+        f"новых {stats['new']}, истекло {stats['expired']}\n"
+    )
+    if stats["sold_prices"]:
+        avg_price = sum(stats["sold_prices"]) / len(stats["sold_prices"])
+        message += f"Средняя цена проданных: {avg_price:,.0f} ₽\n"
+    return message + "\n"
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Обработчик команды /start
@@ -53,6 +83,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "- /remove <название> — удалить из избранного;\n"
         "- /history <название> — история цен на аукционе;\n"
         "- /lots <название> — активные лоты;\n"
+        "- /deals — лучшие предложения на аукционе;\n"
         "- /search <название> — найти ID предмета.\n\n"
         "Можно просто написать название предмета в чат. 💬"
     )
@@ -90,14 +121,16 @@ async def get_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         await update.message.reply_text("⏳ Загружаю историю цен...")
-        history = get_auction_history("ru", item['id'])
+        # Запрос к API блокирующий — выполняем его вне цикла событий
+        history = await asyncio.to_thread(get_auction_history, "ru", item['id'], hedge=True)
 
         if not history:
             await update.message.reply_text("❌ История цен не найдена.")
             return
 
-        message = f"📈 История цен для предмета:\n📦 {item['name']}\n\n"
-        for date, prices in sorted(history.items()):
+        message = STALE_NOTE if is_stale(history) else ""
+        message += f"📈 История цен для предмета:\n📦 {item['name']}\n\n"
+        for date, prices in history.items():
             avg_price = sum(prices) / len(prices) if prices else 0
             min_price = min(prices) if prices else 0
             max_price = max(prices) if prices else 0
@@ -113,8 +146,11 @@ async def get_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text(message)
 
-    except Exception as e:
-        await update.message.reply_text(f"Ошибка при получении истории: {str(e)}")
+    except UpstreamUnavailable as e:
+        await update.message.reply_text(str(e))
+    except Exception:
+        logger.exception("Ошибка при получении истории")
+        await update.message.reply_text("❌ Ошибка при получении истории. Попробуйте позже.")
 
 
 async def get_lots(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -132,7 +168,10 @@ async def get_lots(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         await update.message.reply_text("⏳ Загружаю активные лоты...")
-        lots_data = get_auction_active_lots(item['id'], "ru")
+        lots_data = await asyncio.to_thread(
+            get_auction_active_lots, item['id'], "ru", limit=SNAPSHOT_LIMIT, hedge=True
+        )
+        record_snapshot(item['id'], lots_data)
 
         if not lots_data or "lots" not in lots_data:
             await update.message.reply_text("❌ Активные лоты не найдены.")
@@ -144,8 +183,10 @@ async def get_lots(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("📭 Активных лотов нет.")
             return
 
-        message = f"🛒 Активные лоты для предмета:\n📦 {item['name']}\n\n"
+        message = STALE_NOTE if is_stale(lots_data) else ""
+        message += f"🛒 Активные лоты для предмета:\n📦 {item['name']}\n\n"
         message += f"Всего лотов: {len(lots)}\n\n"
+        message += format_lot_stats(item['id'])
 
         for i, lot in enumerate(lots[:10], 1):
             bid_price = lot.get("price", 0)
@@ -159,8 +200,63 @@ async def get_lots(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         await update.message.reply_text(message)
 
-    except Exception as e:
-        await update.message.reply_text(f"Ошибка при получении лотов: {str(e)}")
+    except UpstreamUnavailable as e:
+        await update.message.reply_text(str(e))
+    except Exception:
+        logger.exception("Ошибка при получении лотов")
+        await update.message.reply_text("❌ Ошибка при получении лотов. Попробуйте позже.")
+
+
+def format_age(timestamp):
+    # Сколько времени прошло с момента проверки, например "5 мин назад"
+    minutes = max(0, int(time.time()) - timestamp) // 60
+    if minutes < 1:
+        return "только что"
+    if minutes < 60:
+        return f"{minutes} мин назад"
+    return f"{minutes // 60} ч {minutes % 60} мин назад"
+
+
+async def show_deals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Обработчик команды /deals
+    categories = [("armor", "🛡️ Броня"), ("weapon", "🔫 Оружие")]
+
+    message = "🔥 Лучшие предложения сейчас (выкуп ниже медианы продаж):\n\n"
+    found = False
+    for category, title in categories:
+        deals = get_top_deals(category)
+        if not deals:
+            continue
+        found = True
+        message += f"{title}:\n"
+        for i, deal in enumerate(deals, 1):
+            message += (
+                f"{i}. {deal['name']} — {deal['price']:,.0f} ₽ "
+                f"(медиана {deal['median']:,.0f} ₽, -{deal['discount']:.0%}, "
+                f"{format_age(deal['time'])})\n"
+            )
+        message += "\n"
+
+    if not found:
+        message = "⏳ Выгодных предложений пока нет — сканирование каталога еще идет."
+
+    await update.message.reply_text(message)
+
+
+async def announce(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Обработчик команды /announce (только для администраторов)
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Команда доступна только администраторам.")
+        return
+
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await update.message.reply_text("ℹ️ Нужно указать текст рассылки. Пример: /announce Обновление бота")
+        return
+
+    chat_ids = [int(user_id) for user_id in load_profiles()]
+    context.bot_data["notifications"].broadcast(chat_ids, f"📢 {parts[1]}")
+    await update.message.reply_text(f"✅ Рассылка поставлена в очередь: {len(chat_ids)} пользователей.")
 
 
 async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -346,7 +442,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "- /add <название> — добавить в избранное;\n"
             "- /remove <название> — удалить из избранного;\n"
             "- /history <название> — показать историю цен;\n"
-            "- /lots <название> — показать активные лоты.\n\n"
+            "- /lots <название> — показать активные лоты;\n"
+            "- /deals — лучшие предложения на аукционе.\n\n"
             "Можно просто написать название предмета в чат. 💬"
         )
         keyboard = [[InlineKeyboardButton("Назад", callback_data="main_menu")]]
@@ -369,13 +466,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         await query.answer("⏳ Загружаю историю...")
         try:
-            history = get_auction_history("ru", item_id)
+            history = await asyncio.to_thread(get_auction_history, "ru", item_id, hedge=True)
             if not history:
                 await query.answer("История не найдена", show_alert=True)
                 return
 
-            message = f"📈 История цен:\n📦 {item_name}\n\n"
-            for date, prices in sorted(history.items()):
+            message = STALE_NOTE if is_stale(history) else ""
+            message += f"📈 История цен:\n📦 {item_name}\n\n"
+            for date, prices in history.items():
                 avg_price = sum(prices) / len(prices) if prices else 0
                 min_price = min(prices) if prices else 0
                 max_price = max(prices) if prices else 0
@@ -387,8 +485,11 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             keyboard = [[InlineKeyboardButton("Назад", callback_data="favorites")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(message[:4000], reply_markup=reply_markup)
-        except Exception as e:
-            await query.answer(f"Ошибка: {str(e)}", show_alert=True)
+        except UpstreamUnavailable as e:
+            await query.answer(str(e), show_alert=True)
+        except Exception:
+            logger.exception("Ошибка при получении истории")
+            await query.answer("Ошибка при получении истории. Попробуйте позже.", show_alert=True)
 
     elif data.startswith("lots_"):
         item_id = data.replace("lots_", "")
@@ -406,14 +507,19 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         await query.answer("⏳ Загружаю лоты...")
         try:
-            lots_data = get_auction_active_lots(item_id, "ru")
+            lots_data = await asyncio.to_thread(
+                get_auction_active_lots, item_id, "ru", limit=SNAPSHOT_LIMIT, hedge=True
+            )
+            record_snapshot(item_id, lots_data)
             lots = lots_data.get("lots", []) if lots_data else []
 
             if not lots:
                 await query.answer("Активных лотов нет", show_alert=True)
                 return
 
-            message = f"🛒 Активные лоты:\n📦 {item_name}\n\nВсего: {len(lots)}\n\n"
+            message = STALE_NOTE if is_stale(lots_data) else ""
+            message += f"🛒 Активные лоты:\n📦 {item_name}\n\nВсего: {len(lots)}\n\n"
+            message += format_lot_stats(item_id)
             for i, lot in enumerate(lots[:10], 1):
                 bid_price = lot.get("price", 0)
                 buyout_price = lot.get("buyoutPrice")
@@ -427,8 +533,11 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             keyboard = [[InlineKeyboardButton("Назад", callback_data="favorites")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(message, reply_markup=reply_markup)
-        except Exception as e:
-            await query.answer(f"Ошибка: {str(e)}", show_alert=True)
+        except UpstreamUnavailable as e:
+            await query.answer(str(e), show_alert=True)
+        except Exception:
+            logger.exception("Ошибка при получении лотов")
+            await query.answer("Ошибка при получении лотов. Попробуйте позже.", show_alert=True)
 
     elif data.startswith("add_"):
         item_id = data.replace("add_", "")
@@ -528,7 +637,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def main():
     # Запуск бота
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).rate_limiter(FloodLimiter()).build()
+    # Уведомления и рассылки отправлять через очередь: context.bot_data["notifications"].notify(...)
+    application.bot_data["notifications"] = NotificationQueue(application.bot)
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -539,11 +650,15 @@ def main():
     application.add_handler(CommandHandler("search", search_item))
     application.add_handler(CommandHandler("history", get_history))
     application.add_handler(CommandHandler("lots", get_lots))
+    application.add_handler(CommandHandler("deals", show_deals))
+    application.add_handler(CommandHandler("announce", announce))
 
     application.add_handler(CallbackQueryHandler(button_callback))
 
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
+    start_scanner()
+
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Фоновый поиск выгодных лотов по всему каталогу предметов
+
+import heapq
+import logging
+import threading
+import time
+from statistics import median
+
+from parser import load_items_data, get_price_history, get_auction_active_lots
+from resilience import UpstreamUnavailable, is_stale, RESET_TIMEOUT
+from lot_tracker import record_snapshot, SNAPSHOT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+SCAN_REGION = "ru"
+
+# Сколько лучших предложений храним в каждой категории
+TOP_K = 10
+
+# Ограничение нагрузки на API: предметов за раунд, пауза между предметами
+# (на каждый предмет уходит два запроса) и пауза между раундами, секунды
+ROUND_SIZE = 20
+REQUEST_INTERVAL = 1.0
+ROUND_INTERVAL = 30
+
+# Медиану считаем по последним HISTORY_LIMIT сделкам (максимум API);
+# минимум сделок, чтобы медиане можно было доверять
+HISTORY_LIMIT = 200
+MIN_HISTORY_PRICES = 5
+
+
+class TopDeals:
+    # Ограниченная куча k лучших предложений: в корне лежит худшее из лучших.
+    # Обновляется при каждом пересканировании предмета за O(k).
+    # Если предмет выпал из топа, место освобождается до тех пор,
+    # пока на него не претендует следующий просканированный предмет
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []  # [(скидка, item_id)]
+        self._deals = {}  # {item_id: предложение}
+
+    def update(self, item_id, deal):
+        # Обновляет предложение по предмету; deal=None убирает предмет из топа
+        if item_id in self._deals:
+            del self._deals[item_id]
+            self._heap = [entry for entry in self._heap if entry[1] != item_id]
+            heapq.heapify(self._heap)
+
+        if deal is None:
+            return
+
+        entry = (deal["discount"], item_id)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            _, dropped_id = heapq.heapreplace(self._heap, entry)
+            del self._deals[dropped_id]
+        else:
+            return
+        self._deals[item_id] = deal
+
+    def top(self):
+        # Возвращает предложения от самого выгодного к наименее выгодному
+        return [self._deals[item_id] for _, item_id in sorted(self._heap, reverse=True)]
+
+
+_top_deals = {"armor": TopDeals(TOP_K), "weapon": TopDeals(TOP_K)}
+_lock = threading.Lock()
+_scanner_thread = None
+
+
+def evaluate_item(item_id, region=SCAN_REGION):
+    # Сравнивает самый дешевый выкуп с медианой недавних продаж.
+    # Возвращает (цена выкупа, медиана) или None, если данных недостаточно.
+    # Если API недоступен, бросает UpstreamUnavailable
+
+    # Самые дешевые выкупы идут первыми, поэтому минимум не теряется на следующих страницах
+    lots_data = get_auction_active_lots(
+        item_id, region, limit=SNAPSHOT_LIMIT, sort="buyout_price", order="asc"
+    )
+    history = get_price_history(region, item_id, limit=HISTORY_LIMIT)
+
+    if is_stale(lots_data) or is_stale(history):
+        # Данные из кэша не обновляют топ: прежнее предложение остается как есть
+        raise UpstreamUnavailable()
+
+    # Сканер регулярно обходит весь каталог — заодно снимаем снимок для статистики продаж
+    record_snapshot(item_id, lots_data)
+
+    buyouts = [lot["buyoutPrice"] for lot in lots_data.get("lots", []) if lot.get("buyoutPrice")]
+
+    if not buyouts or len(history) < MIN_HISTORY_PRICES:
+        return None
+
+    return min(buyouts), median(history.prices)
+
+
+def scan_item(category, name, item_id):
+    # Пересканирует предмет и обновляет топ его категории
+    result = evaluate_item(item_id)
+
+    deal = None
+    if result is not None:
+        price, median_price = result
+        if price < median_price:
+            deal = {
+                "name": name,
+                "id": item_id,
+                "price": price,
+                "median": median_price,
+                "discount": 1 - price / median_price,
+                "time": int(time.time()),
+            }
+
+    with _lock:
+        _top_deals[category].update(item_id, deal)
+
+
+def get_top_deals(category):
+    # Возвращает лучшие предложения категории ("armor" или "weapon")
+    with _lock:
+        return _top_deals[category].top()
+
+
+def _catalog():
+    # Список всех предметов каталога: [(категория, название, id)]
+    armor_data, weapon_data = load_items_data()
+    items = [("armor", name, item_id) for name, item_id in armor_data.items()]
+    items += [("weapon", name, item_id) for name, item_id in weapon_data.items()]
+    return items
+
+
+def _scan_loop():
+    # Бесконечно обходит каталог раундами по ROUND_SIZE предметов
+    items = _catalog()
+    position = 0
+
+    while True:
+        for _ in range(min(ROUND_SIZE, len(items))):
+            category, name, item_id = items[position]
+            position = (position + 1) % len(items)
+            try:
+                scan_item(category, name, item_id)
+            except UpstreamUnavailable:
+                # API недоступен — ждем, пока выключатель даст повторить
+                time.sleep(RESET_TIMEOUT)
+            except Exception:
+                logger.exception("Ошибка при сканировании предмета %s", item_id)
+            time.sleep(REQUEST_INTERVAL)
+
+        time.sleep(ROUND_INTERVAL)
+
+
+def start_scanner():
+    # Запускает фоновый поток сканирования (один раз)
+    global _scanner_thread
+    if _scanner_thread is None:
+        _scanner_thread = threading.Thread(target=_scan_loop, name="deal-scanner", daemon=True)
+        _scanner_thread.start()
+    return _scanner_thread
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Модуль для отслеживания изменений активных лотов между опросами аукциона
+
+import threading
+import time
+from collections import Counter, deque
+
+from price_history import parse_iso_time
+from resilience import is_stale
+
+# Сколько секунд храним события по предмету
+EVENTS_TTL = 24 * 60 * 60
+
+# Сколько лотов запрашивать для снимка (максимум API), иначе лоты,
+# вытесненные за пределы первой страницы, будут выглядеть как проданные
+SNAPSHOT_LIMIT = 200
+
+# Типы событий
+EVENT_NEW = 0
+EVENT_SOLD = 1
+EVENT_EXPIRED = 2
+
+# Последний снимок по предмету: {item_id: (время снимка, Counter{ключ_лота: кол-во лотов})}
+_snapshots = {}
+# События по предмету: {item_id: deque[(время, промежуток, тип, цена, кол-во)]},
+# промежуток — сколько секунд прошло с предыдущего снимка
+_events = {}
+# Снимки приходят и из обработчиков бота, и из фонового сканера
+_lock = threading.Lock()
+
+
+def _parse_time(time_str):
+    # Переводит ISO-время из API в unix-время (секунды)
+    return parse_iso_time(time_str) if time_str else 0
+
+
+def _lot_key(lot):
+    # Ключ лота: у API нет идентификатора лота, поэтому берем набор полей,
+    # которые не меняются за время жизни лота
+    return (
+        _parse_time(lot.get("startTime")),
+        _parse_time(lot.get("endTime")),
+        lot.get("amount", 0),
+        lot.get("startPrice", lot.get("price", 0)),
+        lot.get("buyoutPrice") or 0,
+    )
+
+
+def _build_snapshot(lots_data):
+    # Строит компактный снимок: мультимножество ключей лотов, чтобы
+    # одинаковые лоты, выставленные в одну секунду, не склеивались
+    return Counter(_lot_key(lot) for lot in lots_data.get("lots", []))
+
+
+def _trim_events(events, now):
+    # Удаляет события старше EVENTS_TTL
+    border = now - EVENTS_TTL
+    while events and events[0][0] < border:
+        events.popleft()
+
+
+def record_snapshot(item_id, lots_data, now=None):
+    # Сравнивает новый ответ get_auction_active_lots с предыдущим снимком
+    # и сохраняет события: новые, проданные и истекшие лоты.
+    # Возвращает (кол-во новых, кол-во пропавших) или None, если сравнивать не с чем
+    if not lots_data or "lots" not in lots_data:
+        # Ответ с ошибкой не считаем пустым снимком, иначе все лоты "пропадут"
+        return None
+
+    if is_stale(lots_data):
+        # Кэшированный ответ может быть старше последнего снимка и дал бы ложные события
+        return None
+
+    if now is None:
+        now = int(time.time())
+
+    with _lock:
+        total = lots_data.get("total")
+        if total is not None and total > len(lots_data["lots"]):
+            # Пришли не все лоты — разница между страницами дала бы ложные продажи
+            _snapshots.pop(item_id, None)
+            return None
+
+        snapshot = _build_snapshot(lots_data)
+        previous = _snapshots.get(item_id)
+        _snapshots[item_id] = (now, snapshot)
+
+        if previous is None:
+            return None
+
+        previous_time, previous_lots = previous
+        gap = now - previous_time
+        events = _events.setdefault(item_id, deque())
+        added = snapshot - previous_lots
+        removed = previous_lots - snapshot
+
+        for key, count in added.items():
+            _, _, amount, price, buyout = key
+            for _ in range(count):
+                events.append((now, gap, EVENT_NEW, buyout or price, amount))
+
+        for key, count in removed.items():
+            _, end_time, amount, price, buyout = key
+            # Лот пропал раньше времени окончания — считаем, что его купили
+            kind = EVENT_SOLD if end_time > now else EVENT_EXPIRED
+            for _ in range(count):
+                events.append((now, gap, kind, buyout or price, amount))
+
+        _trim_events(events, now)
+        return sum(added.values()), sum(removed.values())
+
+
+def get_lot_stats(item_id, period=3600, now=None):
+    # Возвращает статистику по событиям предмета за последние period секунд.
+    # None — если предмет еще не сравнивался или события в окне найдены после
+    # перерыва между снимками длиннее period: тогда неизвестно, когда они произошли
+    if now is None:
+        now = int(time.time())
+
+    border = now - period
+    stats = {"new": 0, "sold": 0, "sold_amount": 0, "expired": 0, "sold_prices": []}
+
+    with _lock:
+        if item_id not in _events:
+            return None
+
+        for event_time, gap, kind, price, amount in reversed(_events[item_id]):
+            if event_time < border:
+                break
+            if gap > period:
+                return None
+            if kind == EVENT_NEW:
+                stats["new"] += 1
+            elif kind == EVENT_SOLD:
+                stats["sold"] += 1
+                stats["sold_amount"] += amount
+                stats["sold_prices"].append(price)
+            else:
+                stats["expired"] += 1
+
+    return stats
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# Модуль для исходящих сообщений с учетом лимитов Telegram:
+# общий темп отправки, темп по чатам, приоритеты и повтор после RetryAfter
+
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import timedelta
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: чем меньше, тем раньше уходит запрос
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFICATION = 1
+PRIORITY_BROADCAST = 2
+
+# Общий лимит бота — около 30 сообщений в секунду
+GLOBAL_RATE = 30
+
+# Лимит на чат: личный чат — около 1 сообщения в секунду (с небольшим запасом
+# на всплеск, чтобы ответ на команду не ждал), группа — 20 сообщений в минуту
+CHAT_RATE = 1
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+GROUP_BURST = 1
+
+# Сколько раз повторять запрос после RetryAfter
+MAX_RETRIES = 3
+
+# Сколько ждать новых уведомлений для чата, прежде чем склеить их в одно
+COALESCE_DELAY = 2
+MAX_MESSAGE_LENGTH = 4096
+
+
+def _retry_seconds(error):
+    # retry_after бывает int или timedelta в зависимости от версии библиотеки
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class FloodLimiter(BaseRateLimiter):
+    # Ограничитель запросов для Application: подключается через
+    # Application.builder().rate_limiter(FloodLimiter()).
+    # Приоритет передается через rate_limit_args={"priority": ...},
+    # по умолчанию запрос считается прямым ответом пользователю
+
+    def __init__(self, global_rate=GLOBAL_RATE, max_retries=MAX_RETRIES):
+        self.global_interval = 1 / global_rate
+        self.max_retries = max_retries
+        self._waiting = []  # [(приоритет, номер, future)]
+        self._counter = itertools.count()
+        self._chat_buckets = {}  # {chat_id: (токены, время обновления)}
+        self._paused_until = 0
+        self._next_slot = 0
+        self._wakeup = None
+        self._dispatcher = None
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    async def _dispatch(self):
+        # Выдает разрешения на отправку в порядке приоритета с общим темпом
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = max(self._paused_until, self._next_slot) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            future.set_result(None)
+            self._next_slot = loop.time() + self.global_interval
+
+    async def _acquire_global(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._counter), future))
+        self._wakeup.set()
+        await future
+
+    async def _acquire_chat(self, chat_id):
+        # Корзина токенов на чат; резервирует токен сразу, без гонок между задачами
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+        rate, burst = (GROUP_RATE, GROUP_BURST) if is_group else (CHAT_RATE, CHAT_BURST)
+
+        tokens, updated = self._chat_buckets.get(chat_id, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate) - 1
+        self._chat_buckets[chat_id] = (tokens, now)
+
+        if len(self._chat_buckets) > 10000:
+            self._prune_buckets(now)
+
+        if tokens < 0:
+            await asyncio.sleep(-tokens / rate)
+
+    def _prune_buckets(self, now):
+        # Удаляет корзины чатов, которые давно полностью восстановились
+        idle = [chat_id for chat_id, (_, updated) in self._chat_buckets.items() if now - updated > 60]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery и т.п. не ограничиваем
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_REPLY)
+
+        for attempt in range(self.max_retries + 1):
+            # Повтор — это новое сообщение для Telegram, оно тоже тратит лимит чата
+            await self._acquire_chat(chat_id)
+            await self._acquire_global(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                # Telegram просит подождать — приостанавливаем все отправки
+                loop = asyncio.get_running_loop()
+                self._paused_until = max(self._paused_until, loop.time() + _retry_seconds(e))
+                logger.warning("Превышен лимит Telegram, пауза %s с", e.retry_after)
+
+
+class NotificationQueue:
+    # Очередь уведомлений: несколько уведомлений одному пользователю,
+    # накопившиеся за COALESCE_DELAY секунд, уходят одним сообщением
+
+    def __init__(self, bot, delay=COALESCE_DELAY):
+        self.bot = bot
+        self.delay = delay
+        self._pending = {}  # {chat_id: [приоритет, [тексты]]}
+        self._tasks = set()  # ссылки на задачи, чтобы их не собрал сборщик мусора
+
+    def notify(self, chat_id, text, priority=PRIORITY_NOTIFICATION):
+        # Ставит уведомление в очередь (вызывать из корутины)
+        if chat_id in self._pending:
+            pending = self._pending[chat_id]
+            pending[0] = min(pending[0], priority)
+            pending[1].append(text)
+            return
+
+        self._pending[chat_id] = [priority, [text]]
+        task = asyncio.get_running_loop().create_task(self._flush(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def broadcast(self, chat_ids, text):
+        # Рассылка всем пользователям с самым низким приоритетом
+        for chat_id in chat_ids:
+            self.notify(chat_id, text, PRIORITY_BROADCAST)
+
+    async def _flush(self, chat_id):
+        await asyncio.sleep(self.delay)
+        priority, texts = self._pending.pop(chat_id)
+
+        for message in _join_messages(texts):
+            try:
+                await self.bot.send_message(chat_id, message, rate_limit_args={"priority": priority})
+            except Forbidden:
+                # Пользователь заблокировал бота
+                return
+            except TelegramError:
+                logger.exception("Не удалось отправить уведомление в чат %s", chat_id)
+                return
+
+
+def _join_messages(texts):
+    # Склеивает тексты в сообщения не длиннее MAX_MESSAGE_LENGTH
+    messages = []
+    current = ""
+    for text in texts:
+        text = text[:MAX_MESSAGE_LENGTH]
+        if current and len(current) + 2 + len(text) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n\n{text}" if current else text
+    if current:
+        messages.append(current)
+    return messages
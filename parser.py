@@ -1,8 +1,8 @@
-from requests import get, post
+from resilience import request_json, StaleResult
+from price_history import PriceHistory
 from dotenv import load_dotenv
 import os
 from pathlib import Path
-from datetime import datetime
 import json
 
 
@@ -23,8 +23,8 @@ def get_auth_token():
         "scope": "",
     }
 
-    response = post(url=url, data=params)
-    return response.json()
+    data, _ = request_json("POST", url, data=params)
+    return data
 
 
 TOKEN = None
@@ -38,33 +38,38 @@ def get_token():
     return TOKEN
 
 
-def get_auction_history(region, item_id):
-    # Возвращает историю цен по дням для указанного предмета
-    history_by_date = {}
+def get_price_history(region, item_id, limit=None, hedge=False):
+    # Возвращает историю цен предмета в компактном виде (PriceHistory).
+    # hedge=True — дублировать медленный запрос (только для ответов пользователю)
     url = f"https://eapi.stalcraft.net/{region}/auction/{item_id}/history"
     headers = {"Authorization": get_token()}
-    response = get(url=url, headers=headers)
-
-    for entry in response.json().get("prices", []):
-        time_str = entry["time"]
-        dt_object = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-        date_key = dt_object.strftime("%d.%m.%Y")
-        price = entry["price"]
+    params = {"limit": limit} if limit else None
+    history, stale = request_json(
+        "GET", url, cache_key=("history", region, item_id, limit), hedge=hedge,
+        parse=PriceHistory.from_response, headers=headers, params=params, stream=True
+    )
+    return history.mark_stale() if stale else history
 
-        if date_key not in history_by_date:
-            history_by_date[date_key] = [price]
-        else:
-            history_by_date[date_key].append(price)
 
-    return history_by_date
+def get_auction_history(region, item_id, hedge=False):
+    # Возвращает историю цен по дням для указанного предмета
+    history = get_price_history(region, item_id, hedge=hedge)
+    history_by_date = history.by_day()
+    return StaleResult(history_by_date) if history.stale else history_by_date
 
 
-def get_auction_active_lots(item_id, region):
-    # Возвращает активные лоты по предмету
+def get_auction_active_lots(item_id, region, limit=None, hedge=False, sort=None, order=None):
+    # Возвращает активные лоты по предмету.
+    # sort — поле сортировки API (например "buyout_price"), order — "asc" или "desc"
     headers = {"Authorization": get_token()}
     url = f"https://eapi.stalcraft.net/{region}/auction/{item_id}/lots"
-    response1 = get(url, headers=headers)
-    return response1.json()
+    params = {"limit": limit, "sort": sort, "order": order}
+    params = {key: value for key, value in params.items() if value}
+    data, stale = request_json(
+        "GET", url, cache_key=("lots", region, item_id, limit, sort, order), hedge=hedge,
+        headers=headers, params=params
+    )
+    return StaleResult(data) if stale else data
 
 
 _armor_data = None
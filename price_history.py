@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Компактное хранение истории цен в типизированных массивах
+# и потоковый разбор ответа /history без построения полного списка словарей
+
+import codecs
+import json
+from array import array
+from bisect import bisect_left
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+
+CHUNK_SIZE = 64 * 1024
+
+_EPOCH = date(1970, 1, 1)
+_SEPARATORS = " \t\r\n,"
+
+
+@lru_cache(maxsize=4096)
+def _day_start(date_str):
+    # Unix-время начала дня по строке "YYYY-MM-DD"
+    day = date(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]))
+    return (day - _EPOCH).days * 86400
+
+
+@lru_cache(maxsize=4096)
+def day_key(day_number):
+    # Строка "ДД.ММ.ГГГГ" по номеру дня от начала эпохи (UTC)
+    return (_EPOCH + timedelta(days=day_number)).strftime("%d.%m.%Y")
+
+
+def parse_iso_time(time_str):
+    # Переводит ISO-8601 время в unix-время (секунды).
+    # Быстрый путь для формата API "YYYY-MM-DDTHH:MM:SS[.fff]Z" без создания datetime
+    if len(time_str) >= 20 and time_str[10] == "T" and time_str[-1] == "Z":
+        return (
+            _day_start(time_str[:10])
+            + int(time_str[11:13]) * 3600
+            + int(time_str[14:16]) * 60
+            + int(time_str[17:19])
+        )
+    return int(datetime.fromisoformat(time_str.replace("Z", "+00:00")).timestamp())
+
+
+def iter_price_entries(chunks, key="prices"):
+    # Потоково разбирает JSON-ответ и по одному возвращает элементы массива key.
+    # chunks — последовательность байтовых кусков ответа
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    marker = f'"{key}"'
+    buffer = ""
+    in_array = False
+
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        pos = 0
+
+        if not in_array:
+            key_pos = buffer.find(marker)
+            if key_pos == -1:
+                buffer = buffer[-len(marker):]
+                continue
+            bracket = buffer.find("[", key_pos)
+            if bracket == -1:
+                buffer = buffer[key_pos:]
+                continue
+            pos = bracket + 1
+            in_array = True
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                entry, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Элемент пришел не целиком — ждем следующий кусок
+                break
+            yield entry
+
+        buffer = buffer[pos:]
+
+    if in_array:
+        # Поток закончился раньше закрывающей скобки — обрезанный ответ не кэшируем
+        raise ValueError("Ответ истории цен обрезан")
+
+
+def _is_sorted(values):
+    # Проверяет, что значения идут по неубыванию
+    return all(values[i] <= values[i + 1] for i in range(len(values) - 1))
+
+
+class PriceHistory:
+    # История цен: время (unix), цена и количество в параллельных массивах,
+    # отсортированных по времени. Срезы по времени не копируют данные
+
+    stale = False
+
+    def __init__(self, times=None, prices=None, amounts=None):
+        self.times = times if times is not None else array("q")
+        self.prices = prices if prices is not None else array("q")
+        self.amounts = amounts if amounts is not None else array("q")
+
+    @classmethod
+    def from_entries(cls, entries):
+        # Заполняет историю из элементов ответа API
+        history = cls()
+        times, prices, amounts = history.times, history.prices, history.amounts
+        for entry in entries:
+            times.append(parse_iso_time(entry["time"]))
+            prices.append(entry["price"])
+            amounts.append(entry.get("amount", 1))
+
+        # API отдает сначала новые сделки, храним по возрастанию времени
+        if not _is_sorted(times):
+            times.reverse()
+            prices.reverse()
+            amounts.reverse()
+            if not _is_sorted(times):
+                # Порядок нарушен внутри ответа — сортируем все столбцы вместе
+                order = sorted(range(len(times)), key=times.__getitem__)
+                history.times = array("q", (times[i] for i in order))
+                history.prices = array("q", (prices[i] for i in order))
+                history.amounts = array("q", (amounts[i] for i in order))
+        return history
+
+    @classmethod
+    def from_response(cls, response):
+        # Потоково читает ответ requests (запрошенный с stream=True)
+        return cls.from_entries(iter_price_entries(response.iter_content(CHUNK_SIZE)))
+
+    def __len__(self):
+        return len(self.times)
+
+    def _view(self, start, end, stale=False):
+        view = PriceHistory(
+            memoryview(self.times)[start:end],
+            memoryview(self.prices)[start:end],
+            memoryview(self.amounts)[start:end],
+        )
+        view.stale = stale
+        return view
+
+    def between(self, start_time=None, end_time=None):
+        # Срез истории за [start_time, end_time) без копирования массивов
+        start = 0 if start_time is None else bisect_left(self.times, start_time)
+        end = len(self.times) if end_time is None else bisect_left(self.times, end_time)
+        return self._view(start, max(start, end), self.stale)
+
+    def mark_stale(self):
+        # Та же история, помеченная как данные из кэша
+        return self._view(0, len(self.times), stale=True)
+
+    def by_day(self):
+        # Группирует цены по дням (UTC) в порядке дат: {"ДД.ММ.ГГГГ": цены},
+        # где цены — срез массива без копирования
+        history_by_date = {}
+        position = 0
+        times = self.times
+        while position < len(times):
+            day = times[position] // 86400
+            # Конец дня ищем начиная с текущей позиции и всегда сдвигаемся вперед
+            end = max(position + 1, bisect_left(times, (day + 1) * 86400, position))
+            history_by_date[day_key(day)] = self._view(position, end).prices
+            position = end
+        return history_by_date
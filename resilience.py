@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Модуль для устойчивых запросов к внешним API: таймауты, повторы,
+# хеджированные запросы и автоматический выключатель (circuit breaker)
+
+import random
+import threading
+import time
+from concurrent.futures import Future, as_completed, wait
+from urllib.parse import urlparse
+
+from requests import request
+from requests.exceptions import RequestException
+
+# Таймауты (секунды): установка соединения и чтение ответа
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 8
+
+# Повторы с экспоненциальной задержкой и случайным разбросом
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Если API просит подождать (Retry-After) дольше, не повторяем запрос
+RETRY_AFTER_MAX = 10
+
+# Через сколько секунд без ответа отправлять дублирующий запрос
+# и сколько дублей может выполняться одновременно
+HEDGE_DELAY = 1.5
+MAX_HEDGES_IN_FLIGHT = 2
+
+# Выключатель: сколько ошибок подряд открывает его и на сколько секунд
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+# Свободные места для дублей: если все заняты, дубль не отправляем,
+# чтобы не удваивать нагрузку, когда API и так отвечает медленно
+_hedge_slots = threading.BoundedSemaphore(MAX_HEDGES_IN_FLIGHT)
+
+# Последние успешные ответы: {cache_key: data}
+_last_good = {}
+
+
+class UpstreamUnavailable(Exception):
+    # Внешний API недоступен и сохраненных данных нет
+    def __init__(self, message="⚠️ Сервер аукциона сейчас недоступен. Попробуйте позже."):
+        super().__init__(message)
+
+
+class UpstreamStatusError(RequestException):
+    # Ответ с кодом, при котором запрос стоит повторить
+    pass
+
+
+class StaleResult(dict):
+    # Результат, собранный из последних сохраненных данных, а не из свежего ответа
+    stale = True
+
+
+def is_stale(data):
+    # Проверяет, что данные взяты из кэша из-за недоступности API
+    return getattr(data, "stale", False)
+
+
+class CircuitBreaker:
+    # Выключатель: после серии ошибок перестает пускать запросы на время
+    # RESET_TIMEOUT, затем пропускает один пробный запрос
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        # Можно ли сейчас отправлять запрос
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Пробный запрос; остальные ждут его результата
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# Выключатели по хостам: {host: CircuitBreaker}
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    # Возвращает выключатель для хоста из url
+    host = urlparse(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def _backoff(attempt):
+    # Задержка перед повтором с полным случайным разбросом
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_delay(error, attempt):
+    # Задержка перед повтором; для 429 учитывает Retry-After.
+    # None — повторять не стоит
+    response = getattr(error, "response", None)
+    if response is not None and response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            seconds = int(retry_after)
+            return seconds if seconds <= RETRY_AFTER_MAX else None
+    return _backoff(attempt)
+
+
+def _close_response(future):
+    # Закрывает ответ проигравшего хеджированного запроса, чтобы не держать соединение
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _send(method, url, **kwargs):
+    # Один запрос с таймаутами; коды из RETRY_STATUSES считаются ошибкой
+    response = request(method, url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    if response.status_code in RETRY_STATUSES:
+        response.close()
+        raise UpstreamStatusError(f"HTTP {response.status_code}", response=response)
+    return response
+
+
+def _start(method, url, **kwargs):
+    # Запускает запрос в отдельном потоке сразу, без очереди пула,
+    # чтобы ожидание в очереди не считалось медленным ответом
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(_send(method, url, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="api-request", daemon=True).start()
+    return future
+
+
+def _send_hedged(method, url, **kwargs):
+    # Если ответа нет дольше HEDGE_DELAY и есть свободное место,
+    # отправляет дубль и берет первый успешный ответ
+    first = _start(method, url, **kwargs)
+    done, _ = wait([first], timeout=HEDGE_DELAY)
+    if done or not _hedge_slots.acquire(blocking=False):
+        return first.result()
+
+    second = _start(method, url, **kwargs)
+    second.add_done_callback(lambda _: _hedge_slots.release())
+    error = None
+    for future in as_completed([first, second]):
+        try:
+            response = future.result()
+        except RequestException as e:
+            error = e
+            continue
+        other = second if future is first else first
+        other.add_done_callback(_close_response)
+        return response
+    raise error
+
+
+def _send_with_retries(method, url, hedge, **kwargs):
+    # Запрос с ограниченным числом повторов
+    send = _send_hedged if hedge else _send
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return send(method, url, **kwargs)
+        except RequestException as e:
+            error = e
+            if attempt == MAX_RETRIES:
+                break
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                break
+            time.sleep(delay)
+    raise error
+
+
+def request_json(method, url, cache_key=None, hedge=False, parse=None, **kwargs):
+    # Выполняет запрос и возвращает (json, stale).
+    # parse(response) заменяет response.json(), например для потокового разбора.
+    # Если API недоступен, возвращает последний успешный ответ по cache_key
+    # с stale=True, а если его нет — бросает UpstreamUnavailable
+    breaker = get_breaker(url)
+
+    if breaker.allow():
+        try:
+            response = _send_with_retries(method, url, hedge, **kwargs)
+            data = parse(response) if parse else response.json()
+        except (RequestException, ValueError) as e:
+            # ValueError — некорректный или обрезанный JSON, такой ответ не кэшируем
+            breaker.record_failure()
+            error = e
+        else:
+            breaker.record_success()
+            if cache_key is not None and response.status_code == 200:
+                _last_good[cache_key] = data
+            return data, False
+    else:
+        error = None
+
+    if cache_key in _last_good:
+        return _last_good[cache_key], True
+    raise UpstreamUnavailable() from error